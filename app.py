@@ -5,15 +5,21 @@ import joblib
 import psycopg2
 import os
 import numpy as np
-from idea_indexer.paths import DATA_DIR, ARTIFACTS_DIR, OUTPUTS_DIR
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, nullcontext
+from idea_indexer.paths import CorpusPaths
 from idea_indexer.utils.jsonl import write_jsonl, read_jsonl
-from idea_indexer.utils.pdf_text import extract_pdf_pages
+from idea_indexer.utils.pdf_text import submit_pdf_pages
 from idea_indexer.utils.excel_extractor import extract_excel
 from idea_indexer.indexing.index_builder import build_index
+from idea_indexer.indexing.dense import reciprocal_rank_fusion
+from idea_indexer.indexing.scoring import (
+    load_artifact, rows_to_csr, map_positions, cosine_scores, topk, page_location)
 from idea_indexer.llm.extract import extract_for_project
 from idea_indexer.utils.jsonl import write_json
-from sklearn.metrics.pairwise import cosine_similarity
-from shutil import copyfile
+from idea_indexer.utils.atomic import atomic_path, file_lock
+from idea_indexer.utils.profiling import profiler
+from idea_indexer.settings import settings
 
 
 app = typer.Typer(help="Mini Knowledge Indexer (OpenAI)")
@@ -27,22 +33,75 @@ def get_conn():
         dbname=os.getenv("POSTGRES_DB", "idea_indexer")
     )
 
+
+# Select the corpus (ctx.obj) and reset stage timers per command;
+# --profile also wraps the command in cProfile.
+@app.callback()
+def main(ctx: typer.Context,
+         profile: bool = typer.Option(False, "--profile", help="Run the command under cProfile"),
+         corpus: str = typer.Option(None, "--corpus", envvar="CORPUS",
+                                    help="Corpus (tenant) name; default is the top-level data/")):
+    command = ctx.invoked_subcommand or ""
+    try:
+        paths = CorpusPaths(corpus)
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--corpus")
+    # Checked before ensure() so a mistyped corpus leaves no empty dirs behind
+    if command == "ingest" and not paths.data_dir.is_dir():
+        raise typer.BadParameter(f"No data directory: {paths.data_dir}",
+                                 param_hint="--corpus")
+    ctx.obj = paths.ensure()
+
+    profiler.reset(command, paths.name)
+    if command == "reset":
+        return
+    if profile:
+        profiler.start_cprofile()
+
+    def _flush():
+        profiler.flush(paths.outputs_dir / "trace.jsonl",
+                       paths.outputs_dir / "metrics.prom",
+                       paths.outputs_dir / f"profile_{command}.prof" if profile else None)
+    ctx.call_on_close(_flush)
+
 # Parse data/ and write artifacts/pages.jsonl
 
 
 @app.command()
-def ingest():
+def ingest(ctx: typer.Context):
+    paths = ctx.obj
     rows = []
-    for i, proj_dir in enumerate(sorted(DATA_DIR.iterdir()), start=1):
-        if not proj_dir.is_dir():
-            continue
-        project_title = proj_dir.name
-        project_id = f"PRJ-{project_title}"
+    pool = ProcessPoolExecutor(settings.pdf_workers) \
+        if settings.pdf_workers > 1 else nullcontext()
+    with profiler.stage("ingest.parse"), pool as executor:
+        # Submit every PDF first so the pool renders files concurrently,
+        # then collect in file order to keep pages.jsonl ordering stable.
+        jobs = []
+        for i, proj_dir in enumerate(sorted(paths.data_dir.iterdir()), start=1):
+            if not proj_dir.is_dir():
+                continue
+            project_title = proj_dir.name
+            # Named corpora share the DB, so their project ids carry the corpus name
+            project_id = f"PRJ-{paths.name}-{project_title}" if paths.name \
+                else f"PRJ-{project_title}"
 
-        for f in sorted(proj_dir.iterdir()):
-            try:
+            for f in sorted(proj_dir.iterdir()):
+                collect = None
                 if f.suffix.lower() == ".pdf":
-                    for page, text in extract_pdf_pages(f):
+                    try:
+                        collect = submit_pdf_pages(
+                            f, paths.artifacts_dir / "page_cache", executor,
+                            settings.pdf_skip_image_only)
+                    except Exception:
+                        profiler.count("files_failed")
+                        continue
+                jobs.append((f, project_id, project_title, collect))
+
+        for f, project_id, project_title, collect in jobs:
+            try:
+                if collect is not None:
+                    for page, text in collect():
+                        profiler.count("pages_parsed")
                         if text.strip():
                             rows.append({
                                 "file_path": str(f),
@@ -53,47 +112,54 @@ def ingest():
                             })
                 elif f.suffix.lower() in {".xls", ".xlsx"}:
                     for rec in extract_excel(f):
+                        profiler.count("excel_rows_parsed")
                         rec.update({"project_id": project_id,
                                    "project_title": project_title})
                         rows.append(rec)
             except Exception:
+                profiler.count("files_failed")
                 continue
 
-    out_path = ARTIFACTS_DIR / "pages.jsonl"
-    write_jsonl(out_path, rows)
-
-   # --- Save ingested pages into DB ---
-    conn = get_conn()
-    page_ids = []
-    with conn:
-        with conn.cursor() as cur:
-            for r in rows:
-                cur.execute("""
-                    INSERT INTO pages (project_id, project_title, file_path, page, text)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (project_id, file_path, page) DO NOTHING
-                    RETURNING id
-                """, (
-                    r.get("project_id"),
-                    r.get("project_title", ""),
-                    str(r.get("file_path")),
-                    int(r.get("page", 0)),
-                    r.get("text", "")
-                ))
-                row = cur.fetchone()
-                if row is not None:
-                    page_ids.append(row[0])
-                else:
-                    # אם כבר קיים – נביא את ה-id הקיים כדי לשמור על סנכרון page_ids.jsonl
+    with file_lock(paths.lock_path):
+        # --- Save ingested pages into DB ---
+        conn = get_conn()
+        page_ids = []
+        with profiler.stage("ingest.db_write"), conn:
+            with conn.cursor() as cur:
+                for r in rows:
                     cur.execute("""
-                        SELECT id FROM pages
-                        WHERE project_id=%s AND file_path=%s AND page=%s
-                    """, (r.get("project_id"), str(r.get("file_path")), int(r.get("page", 0))))
-                    page_ids.append(cur.fetchone()[0])
-
-    conn.close()
+                        INSERT INTO pages (project_id, project_title, file_path, page, text)
+                        VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT (project_id, file_path, page) DO NOTHING
+                        RETURNING id
+                    """, (
+                        r.get("project_id"),
+                        r.get("project_title", ""),
+                        str(r.get("file_path")),
+                        int(r.get("page", 0)),
+                        r.get("text", "")
+                    ))
+                    row = cur.fetchone()
+                    if row is not None:
+                        page_ids.append(row[0])
+                    else:
+                        # אם כבר קיים – נביא את ה-id הקיים כדי לשמור על סנכרון page_ids.jsonl
+                        cur.execute("""
+                            SELECT id FROM pages
+                            WHERE project_id=%s AND file_path=%s AND page=%s
+                        """, (r.get("project_id"), str(r.get("file_path")), int(r.get("page", 0))))
+                        page_ids.append(cur.fetchone()[0])
+                    profiler.count("rows_written")
 
-    write_jsonl(ARTIFACTS_DIR / "page_ids.jsonl", page_ids)
+        conn.close()
+        profiler.memory("ingest.done")
+
+        # Written back to back after the DB commit so pages.jsonl and page_ids.jsonl stay aligned
+        out_path = paths.artifacts_dir / "pages.jsonl"
+        write_jsonl(out_path, rows)
+        write_jsonl(paths.artifacts_dir / "page_ids.jsonl", page_ids)
+        # dense.pkl row ids are pages.jsonl positions, so it is stale from here on
+        (paths.artifacts_dir / "dense.pkl").unlink(missing_ok=True)
     print(f"✅ Saved {len(rows)} pages to database")
 
     typer.echo(f"Ingested {len(rows)} items -> {out_path}")
@@ -102,34 +168,54 @@ def ingest():
 
 
 @app.command("build-index")
-def build_index_cmd():
-    pages = ARTIFACTS_DIR / "pages.jsonl"
-    tfidf_pkl = ARTIFACTS_DIR / "tfidf.pkl"
-    build_index(pages, tfidf_pkl)
-    typer.echo(f"Built TF-IDF index -> {tfidf_pkl}")
-
-    copyfile(pages, OUTPUTS_DIR / "index.jsonl")
-    typer.echo(f"Wrote {OUTPUTS_DIR / 'index.jsonl'}")
+def build_index_cmd(ctx: typer.Context,
+                    dense: bool = typer.Option(settings.dense_retrieval, "--dense/--no-dense",
+                                               help="Also build the local dense (ANN) index")):
+    paths = ctx.obj
+    pages = paths.artifacts_dir / "pages.jsonl"
+    tfidf_pkl = paths.artifacts_dir / "tfidf.pkl"
+    dense_pkl = paths.artifacts_dir / "dense.pkl"
+
+    # One index build per corpus at a time, and no query/extract reads meanwhile.
+    # tfidf.pkl / dense.pkl are built into temp files and only renamed into place
+    # (on leaving the ExitStack) after the DB vectors have committed.
+    with file_lock(paths.lock_path), ExitStack() as publish:
+        tfidf_tmp = publish.enter_context(atomic_path(tfidf_pkl))
+        dense_tmp = publish.enter_context(atomic_path(dense_pkl)) if dense else None
+        if not dense:
+            # A stale dense index would no longer be aligned with pages.jsonl
+            dense_pkl.unlink(missing_ok=True)
+        with profiler.stage("index.vectorize"):
+            build_index(pages, tfidf_tmp, dense_tmp)
+
+        # --- Persist TF-IDF vectors into DB aligned with page_ids ---
+        vectorizer, X = joblib.load(tfidf_tmp)
+        page_ids = list(read_jsonl(paths.artifacts_dir / "page_ids.jsonl"))
+
+        if X.shape[0] != len(page_ids):
+            raise RuntimeError(
+                f"Vector rows ({X.shape[0]}) != page_ids count ({len(page_ids)})")
 
-    # --- Persist TF-IDF vectors into DB aligned with page_ids ---
-    vectorizer, X = joblib.load(ARTIFACTS_DIR / "tfidf.pkl")
-    page_ids = list(read_jsonl(ARTIFACTS_DIR / "page_ids.jsonl"))
-
-    if X.shape[0] != len(page_ids):
-        raise RuntimeError(
-            f"Vector rows ({X.shape[0]}) != page_ids count ({len(page_ids)})")
+        conn = get_conn()
+        with profiler.stage("index.db_write"), conn:
+            with conn.cursor() as cur:
+                for i, pid in enumerate(page_ids):
+                    vec_list = X[i].toarray()[0].tolist()
+                    cur.execute("""
+                        INSERT INTO page_vectors (page_id, vector)
+                        VALUES (%s, %s)
+                        ON CONFLICT (page_id) DO UPDATE SET vector = EXCLUDED.vector
+                    """, (int(pid), vec_list))
+                    profiler.count("vectors_written")
+        conn.close()
 
-    conn = get_conn()
-    with conn:
-        with conn.cursor() as cur:
-            for i, pid in enumerate(page_ids):
-                vec_list = X[i].toarray()[0].tolist()
-                cur.execute("""
-                    INSERT INTO page_vectors (page_id, vector)
-                    VALUES (%s, %s)
-                    ON CONFLICT (page_id) DO UPDATE SET vector = EXCLUDED.vector
-                """, (int(pid), vec_list))
-    conn.close()
+        with atomic_path(paths.outputs_dir / "index.jsonl") as tmp:
+            shutil.copyfile(pages, tmp)
+    profiler.memory("index.done")
+    typer.echo(f"Built TF-IDF index -> {tfidf_pkl}")
+    if dense:
+        typer.echo(f"Built dense index -> {dense_pkl}")
+    typer.echo(f"Wrote {paths.outputs_dir / 'index.jsonl'}")
     typer.echo(f"Stored {len(page_ids)} vectors into database")
 
 
@@ -137,9 +223,14 @@ def build_index_cmd():
 
 
 @app.command()
-def extract():
-    pages = ARTIFACTS_DIR / "pages.jsonl"
-    tfidf_pkl = ARTIFACTS_DIR / "tfidf.pkl"
+def extract(ctx: typer.Context):
+    paths = ctx.obj
+    # Shared lock for the whole run: pages.jsonl and tfidf.pkl cannot change under us
+    ctx.with_resource(file_lock(paths.lock_path, shared=True))
+    pages = paths.artifacts_dir / "pages.jsonl"
+    tfidf_pkl = paths.artifacts_dir / "tfidf.pkl"
+    dense_pkl = paths.artifacts_dir / "dense.pkl"
+    dense_pkl = dense_pkl if dense_pkl.exists() else None
 
     proj_map = {}
     for r in read_jsonl(pages):
@@ -149,17 +240,20 @@ def extract():
             proj_map[pid] = ptitle
 
     for pid, ptitle in proj_map.items():
-        data = extract_for_project(pid, tfidf_pkl, pages)
+        with profiler.stage("extract.project"):
+            data = extract_for_project(pid, tfidf_pkl, pages, dense_pkl,
+                                       paths.artifacts_dir, paths.outputs_dir)
+        profiler.count("projects_extracted")
         if not data.get("project_title"):
             data["project_title"] = ptitle or ""
 
-        out_path = OUTPUTS_DIR / f"{pid}_key_params.json"
+        out_path = paths.outputs_dir / f"{pid}_key_params.json"
         write_json(out_path, data)
         typer.echo(f"Wrote {out_path}")
 
         # --- Persist extracted project data into DB ---
         conn = get_conn()
-        with conn:
+        with profiler.stage("extract.db_write"), conn:
             with conn.cursor() as cur:
                 # Project info
                 cur.execute("""
@@ -235,72 +329,83 @@ def extract():
             "project_id": r.get("project_id", ""),
             "project_title": r.get("project_title", ""),
         })
-    write_jsonl(OUTPUTS_DIR / "manifest.jsonl", manifest)
-    typer.echo(f"Wrote {OUTPUTS_DIR / 'manifest.jsonl'}")
+    write_jsonl(paths.outputs_dir / "manifest.jsonl", manifest)
+    typer.echo(f"Wrote {paths.outputs_dir / 'manifest.jsonl'}")
 
 # Local search over TF-IDF (no LLM calls)
 
 
 @app.command()
-def query(q: str = typer.Option(..., "--q", help="Your question")):
+def query(ctx: typer.Context, q: str = typer.Option(..., "--q", help="Your question")):
+    paths = ctx.obj
+    # Shared lock: ingest / build-index cannot swap artifacts or DB vectors mid-query
+    ctx.with_resource(file_lock(paths.lock_path, shared=True))
 
     # נטען רק את הווקטורייזר מה-pkl (X נבנה מה-DB)
-    vectorizer, _ = joblib.load(ARTIFACTS_DIR / "tfidf.pkl")
+    with profiler.stage("query.load"):
+        vectorizer, _ = load_artifact(paths.artifacts_dir / "tfidf.pkl")
 
     # נטען את הדוקומנטים לפי ה-ingest האחרון (pages.jsonl)
-    docs = list(read_jsonl(ARTIFACTS_DIR / "pages.jsonl"))
+    docs = list(read_jsonl(paths.artifacts_dir / "pages.jsonl"))
 
     # נטען את page_ids.jsonl כדי לשמור יישור מדויק בין docs לבין הווקטורים
-    page_ids_path = ARTIFACTS_DIR / "page_ids.jsonl"
+    page_ids_path = paths.artifacts_dir / "page_ids.jsonl"
     page_ids = [int(x) for x in read_jsonl(page_ids_path)
                 ] if page_ids_path.exists() else []
+    if page_ids and len(page_ids) != len(docs):
+        raise RuntimeError(
+            f"pages.jsonl rows ({len(docs)}) != page_ids count ({len(page_ids)})")
 
     # נקרא מה-DB את הווקטורים רק עבור ה-ids האלו
-    conn = get_conn()
-    with conn.cursor() as cur:
-        # נביא (page_id, vector) למילון
-        cur.execute(
-            "SELECT page_id, vector FROM page_vectors WHERE page_id = ANY(%s)", (page_ids,))
-        rows = cur.fetchall()
-    conn.close()
-
-    vec_by_id = {pid: np.array(vec) for (pid, vec) in rows}
+    with profiler.stage("query.db_load"):
+        conn = get_conn()
+        with conn.cursor() as cur:
+            # נביא (page_id, vector) למילון
+            cur.execute(
+                "SELECT page_id, vector FROM page_vectors WHERE page_id = ANY(%s)", (page_ids,))
+            rows = cur.fetchall()
+        conn.close()
 
-    X_list = [vec_by_id[pid] for pid in page_ids if pid in vec_by_id]
-    X = np.vstack(X_list) if X_list else np.empty((0, 0))
+        # Integer id arrays map every pages.jsonl position to its DB vector row
+        row_ids = np.fromiter((pid for pid, _ in rows), dtype=np.int64,
+                              count=len(rows))
+        doc_pos, doc_rows = map_positions(page_ids, row_ids)
+        X = rows_to_csr(vec for _, vec in rows)
+    profiler.count("vectors_loaded", X.shape[0])
 
     # אם אין בכלל וקטורים – נחזיר תוצאה ריקה במקום להתרסק
-    if X.size == 0 or X.shape[0] == 0:
+    if X.shape[0] == 0:
         typer.echo(json.dumps({"query": q, "results": []},
                               ensure_ascii=False, indent=2))
         return
 
-    # אם מסיבה כלשהי האורך לא זהה, נגביל את docs לאותו אורך כדי לא לקבל IndexError
-    if len(docs) != len(X_list):
-        docs = docs[:len(X_list)]
-
-    qvec = vectorizer.transform([q])
-    sims = cosine_similarity(qvec, X)[0]
-    idxs = sorted(range(len(sims)), key=lambda i: sims[i], reverse=True)[:5]
-
-    out = []
-    for i in idxs:
-        d = docs[i]
-        loc = {}
-        if "page" in d:  # PDF
-            loc["page"] = d["page"]
-        else:            # Excel
-            if "sheet" in d:
-                loc["sheet"] = d["sheet"]
-            if "row" in d:
-                loc["row"] = d["row"]
-
-        out.append({
-            "file_path": d["file_path"],
-            **loc,
-            "score": float(sims[i]),
-            "snippet": d["text"][:400]
-        })
+    dense_pkl = paths.artifacts_dir / "dense.pkl"
+    use_dense = dense_pkl.exists()
+
+    with profiler.stage("query.similarity"):
+        sims = cosine_scores(vectorizer.transform([q]), X)[doc_rows]
+        top = topk(sims, 20 if use_dense else 5)
+        idxs = doc_pos[top].tolist()
+        scores = dict(zip(idxs, sims[top].tolist()))
+
+    if use_dense:
+        with profiler.stage("query.dense"):
+            dense_ids, _ = load_artifact(dense_pkl).search(q, k=20, n_docs=len(docs))
+            # Pages with no term overlap must not get TF-IDF rank credit
+            lexical = doc_pos[top[sims[top] > 0]].tolist()
+            fused = reciprocal_rank_fusion([lexical, dense_ids], limit=5)
+            idxs = [i for i, _ in fused]
+            scores = dict(fused)
+
+    out = [
+        {
+            "file_path": docs[i]["file_path"],
+            **page_location(docs[i]),
+            "score": scores[i],
+            "snippet": docs[i]["text"][:400]
+        }
+        for i in idxs
+    ]
 
     typer.echo(json.dumps({"query": q, "results": out},
                ensure_ascii=False, indent=2))
@@ -308,14 +413,18 @@ def query(q: str = typer.Option(..., "--q", help="Your question")):
 
 # Developer utility - clears artifacts / and outputs / (not part of main flow)
 @app.command()
-def reset():
-    for p in [ARTIFACTS_DIR, OUTPUTS_DIR]:
-        if p.exists():
-            for child in p.iterdir():
-                if child.is_file():
-                    child.unlink()
-                else:
-                    shutil.rmtree(child, ignore_errors=True)
+def reset(ctx: typer.Context):
+    paths = ctx.obj
+    with file_lock(paths.lock_path):
+        for p in [paths.artifacts_dir, paths.outputs_dir]:
+            if p.exists():
+                for child in p.iterdir():
+                    if child == paths.lock_path:
+                        continue
+                    if child.is_file():
+                        child.unlink()
+                    else:
+                        shutil.rmtree(child, ignore_errors=True)
     typer.echo("Cleared artifacts/ and outputs/.")
 
 
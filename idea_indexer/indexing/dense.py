@@ -0,0 +1,106 @@
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from sklearn.random_projection import SparseRandomProjection
+
+# Below this many pages every IVF list is probed (exact search).
+EXACT_SEARCH_MAX_DOCS = 2000
+RRF_K = 60
+
+
+# Local CPU-only embedder: hashed character n-grams -> random projection -> L2 norm.
+class HashedNgramEmbedder:
+    def __init__(self, dim: int = 256, n_features: int = 2**18, seed: int = 0):
+        self.hasher = HashingVectorizer(analyzer="char_wb", ngram_range=(3, 5),
+                                        n_features=n_features, alternate_sign=False,
+                                        norm="l2")
+        self.projection = SparseRandomProjection(n_components=dim,
+                                                 random_state=seed)
+        # Fit only draws the random matrix; it needs the input width, not data.
+        self.projection.fit(self.hasher.transform([""]))
+
+    def embed(self, texts) -> np.ndarray:
+        Z = self.projection.transform(self.hasher.transform(texts))
+        Z = np.asarray(Z.todense() if hasattr(Z, "todense") else Z,
+                       dtype=np.float32)
+        return normalize(Z)
+
+
+# Map unit vectors to int8 codes; dot(codes) / 127**2 approximates cosine.
+def quantize_int8(Z: np.ndarray) -> np.ndarray:
+    return np.clip(np.rint(Z * 127.0), -127, 127).astype(np.int8)
+
+
+# Quantized embeddings searched through an inverted-file (IVF) ANN index.
+class DenseIndex:
+    def __init__(self, embedder: HashedNgramEmbedder | None = None):
+        self.embedder = embedder or HashedNgramEmbedder()
+        self.codes = np.empty((0, 0), dtype=np.int8)
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.order = np.empty(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+
+    def fit(self, texts):
+        Z = self.embedder.embed(texts)
+        self.codes = quantize_int8(Z)
+        n = Z.shape[0]
+        if n == 0:
+            return self
+
+        nlist = max(1, int(np.sqrt(n)))
+        km = KMeans(n_clusters=nlist, n_init=1, random_state=0).fit(Z)
+        self.centroids = normalize(km.cluster_centers_).astype(np.float32)
+        assign = km.labels_
+        # Row ids grouped by list: list j is order[offsets[j]:offsets[j+1]]
+        self.order = np.argsort(assign, kind="stable")
+        self.offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+        return self
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    # Return (row ids, approx cosine scores) of the k nearest pages, best first.
+    # Row ids are positions in the pages the index was fit on; pass n_docs (the
+    # current page count) to refuse an index built for a different pages.jsonl.
+    def search(self, query: str, k: int = 12, nprobe: int | None = None,
+               n_docs: int | None = None):
+        if n_docs is not None and n_docs != self.codes.shape[0]:
+            raise ValueError(
+                f"dense index has {self.codes.shape[0]} rows but pages.jsonl has "
+                f"{n_docs}; re-run build-index --dense")
+        if self.codes.shape[0] == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        q = self.embedder.embed([query])[0]
+        if nprobe is None:
+            nprobe = self.nlist if self.codes.shape[0] <= EXACT_SEARCH_MAX_DOCS \
+                else max(1, self.nlist // 8)
+        nprobe = min(nprobe, self.nlist)
+
+        lists = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+        cand = np.concatenate(
+            [self.order[self.offsets[j]:self.offsets[j + 1]] for j in lists])
+        # KMeans can leave clusters empty, so the probed lists may hold nothing
+        if cand.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        qcode = quantize_int8(q[None, :])[0].astype(np.int32)
+        scores = (self.codes[cand].astype(np.int32) @ qcode) / (127.0 * 127.0)
+        k = min(k, cand.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return cand[top], scores[top].astype(np.float32)
+
+
+# Reciprocal-rank fusion of several best-first rankings of row ids.
+def reciprocal_rank_fusion(rankings, k: int = RRF_K, limit: int | None = None):
+    fused = {}
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking):
+            idx = int(idx)
+            fused[idx] = fused.get(idx, 0.0) + 1.0 / (k + rank + 1)
+    out = sorted(fused.items(), key=lambda x: x[1], reverse=True)
+    return out[:limit] if limit is not None else out
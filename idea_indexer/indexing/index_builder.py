@@ -1,13 +1,21 @@
 import joblib
 from pathlib import Path
 from sklearn.feature_extraction.text import TfidfVectorizer
+from idea_indexer.indexing.dense import DenseIndex
 from idea_indexer.utils.jsonl import read_jsonl
+from idea_indexer.utils.atomic import atomic_path
 
 
 # Build TF-IDF index from extracted text pages and fit a TF-IDF model.
-def build_index(pages_jsonl: Path, tfidf_pkl: Path):
+# If dense_pkl is given, also build the quantized dense (ANN) index next to it.
+def build_index(pages_jsonl: Path, tfidf_pkl: Path, dense_pkl: Path | None = None):
     docs = list(read_jsonl(pages_jsonl))
     texts = [d["text"] for d in docs]
     vectorizer = TfidfVectorizer()
     X = vectorizer.fit_transform(texts)
-    joblib.dump((vectorizer, X), tfidf_pkl)
+    with atomic_path(tfidf_pkl) as tmp:
+        joblib.dump((vectorizer, X), tmp)
+
+    if dense_pkl is not None:
+        with atomic_path(dense_pkl) as tmp:
+            joblib.dump(DenseIndex().fit(texts), tmp)
@@ -0,0 +1,75 @@
+from pathlib import Path
+import joblib
+import numpy as np
+from scipy import sparse
+
+_LOADED = {}
+
+
+# Load an artifact once per process; reloads only when the file's mtime changes.
+def load_artifact(path: Path, loader=joblib.load):
+    path = Path(path)
+    mtime = path.stat().st_mtime_ns
+    hit = _LOADED.get(str(path))
+    if hit is None or hit[0] != mtime:
+        hit = (mtime, loader(path))
+        _LOADED[str(path)] = hit
+    return hit[1]
+
+
+# Build a CSR matrix from equal-length dense vectors (e.g. DB FLOAT8[] rows),
+# keeping only each row's non-zeros so the full dense N x V array never exists.
+def rows_to_csr(vectors) -> sparse.csr_matrix:
+    indptr, indices, data = [0], [], []
+    width = 0
+    for vec in vectors:
+        row = np.asarray(vec, dtype=np.float64)
+        width = row.shape[0]
+        nz = np.flatnonzero(row)
+        indices.append(nz)
+        data.append(row[nz])
+        indptr.append(indptr[-1] + nz.shape[0])
+    if not indices:
+        return sparse.csr_matrix((0, 0))
+    return sparse.csr_matrix(
+        (np.concatenate(data), np.concatenate(indices), np.asarray(indptr)),
+        shape=(len(indices), width))
+
+
+# Map pages.jsonl positions (page_ids) to DB vector rows (row_ids).
+# Returns (positions that have a vector, their row in row_ids). page_ids may
+# repeat - Excel rows of one file share page=0 in the DB - and every position is kept.
+def map_positions(page_ids, row_ids):
+    ids = np.asarray(page_ids, dtype=np.int64)
+    row_ids = np.asarray(row_ids, dtype=np.int64)
+    if row_ids.shape[0] == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    order = np.argsort(row_ids)
+    j = np.minimum(np.searchsorted(row_ids[order], ids), row_ids.shape[0] - 1)
+    pos = np.flatnonzero(row_ids[order][j] == ids)
+    return pos, order[j[pos]]
+
+
+# Cosine scores of one query row against every row of X.
+# TF-IDF rows are already L2-normalised, so only the query needs normalising.
+def cosine_scores(qvec, X) -> np.ndarray:
+    q = sparse.csr_matrix(qvec, dtype=np.float64)
+    qnorm = np.sqrt(q.multiply(q).sum())
+    if X.shape[0] == 0 or qnorm == 0:
+        return np.zeros(X.shape[0])
+    return np.asarray(X @ q.T.toarray()).ravel() / qnorm
+
+
+# Indices of the k highest scores, best first, without sorting every score.
+def topk(scores: np.ndarray, k: int) -> np.ndarray:
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+# page / sheet / row of a pages.jsonl record (PDF pages vs Excel rows).
+def page_location(d: dict) -> dict:
+    return {key: d[key] for key in ("page", "sheet", "row") if key in d}
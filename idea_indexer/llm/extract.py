@@ -3,9 +3,10 @@ import json
 from typing import List, Dict
 from idea_indexer.paths import ARTIFACTS_DIR, OUTPUTS_DIR
 from idea_indexer.utils.jsonl import read_jsonl
-import joblib
-from sklearn.metrics.pairwise import cosine_similarity
+from idea_indexer.indexing.dense import reciprocal_rank_fusion
+from idea_indexer.indexing.scoring import load_artifact, cosine_scores, topk, page_location
 from idea_indexer.llm.llm_client import LLMClient
+from idea_indexer.utils.profiling import profiler
 
 SCHEMA_EXAMPLE = {
     "project_id": "",
@@ -19,6 +20,10 @@ SCHEMA_EXAMPLE = {
     "evidence": [],
 }
 
+# Fields the LLM has to fill; project_id and evidence are set by extract_for_project.
+LLM_SCHEMA = {k: v for k, v in SCHEMA_EXAMPLE.items()
+              if k not in ("project_id", "evidence")}
+
 # Minimal prompt that asks the LLM to return JSON matching the schema.
 PROMPT_TEMPLATE = (
     "System: You are an extraction service. Output only JSON matching the schema.\n"
@@ -29,36 +34,44 @@ PROMPT_TEMPLATE = (
 
 
 # Rank top-k relevant docs using TF-IDF cosine similarity.
-def rank_topk(tfidf_pkl: Path, pages_jsonl: Path, query: str, k: int = 12) -> List[Dict]:
-
-    vectorizer, X = joblib.load(tfidf_pkl)
-    docs = list(read_jsonl(pages_jsonl))
-    qvec = vectorizer.transform([query])
-    sims = cosine_similarity(qvec, X)[0]
-    top = sorted([(i, float(sims[i])) for i in range(len(sims))],
-                 key=lambda x: x[1], reverse=True)[:k]
-
-    hits = []
-    for idx, score in top:
-        d = docs[idx]
-        rec = {
+# With a dense index, TF-IDF and dense rankings are fused with RRF (score = fused score).
+def rank_topk(tfidf_pkl: Path, pages_jsonl: Path, query: str, k: int = 12,
+              dense_pkl: Path | None = None) -> List[Dict]:
+
+    with profiler.stage("retrieval.load"):
+        vectorizer, X = load_artifact(tfidf_pkl)
+        docs = load_artifact(pages_jsonl, lambda p: list(read_jsonl(p)))
+    with profiler.stage("retrieval.similarity"):
+        sims = cosine_scores(vectorizer.transform([query]), X)
+        depth = k if dense_pkl is None else k * 4
+        top_ids = topk(sims, depth)
+        top = zip(top_ids.tolist(), sims[top_ids].tolist())
+    if dense_pkl is not None:
+        with profiler.stage("retrieval.dense"):
+            dense_ids, _ = load_artifact(dense_pkl).search(query, k=depth,
+                                                           n_docs=len(docs))
+            # Pages with no term overlap must not get TF-IDF rank credit
+            lexical = top_ids[sims[top_ids] > 0]
+            top = reciprocal_rank_fusion([lexical, dense_ids], limit=k)
+
+    return [
+        {
             "score": score,
-            "file_path": d["file_path"],
-            "project_id": d["project_id"],
-            "text": d.get("text", "")[:1200],
+            "file_path": docs[idx]["file_path"],
+            "project_id": docs[idx]["project_id"],
+            "text": docs[idx].get("text", "")[:1200],
+            **page_location(docs[idx]),
         }
-        if "page" in d:
-            rec["page"] = d["page"]
-        if "sheet" in d:
-            rec["sheet"] = d["sheet"]
-        if "row" in d:
-            rec["row"] = d["row"]
-        hits.append(rec)
-    return hits
+        for idx, score in top
+    ]
 
 
 # Collect project evidence, call the LLM, and fill schema keys (use LLM values or empty defaults).
-def extract_for_project(project_id: str, tfidf_pkl: Path, pages_jsonl: Path) -> Dict:
+# artifacts_dir / outputs_dir select the corpus whose LLM cache and cost log are used.
+def extract_for_project(project_id: str, tfidf_pkl: Path, pages_jsonl: Path,
+                        dense_pkl: Path | None = None,
+                        artifacts_dir: Path = ARTIFACTS_DIR,
+                        outputs_dir: Path = OUTPUTS_DIR) -> Dict:
     queries = [
         "start date end date milestones schedule",
         "contacts email phone",
@@ -71,7 +84,7 @@ def extract_for_project(project_id: str, tfidf_pkl: Path, pages_jsonl: Path) ->
     evidence = []
     seen = set()
     for q in queries:
-        hits = [h for h in rank_topk(tfidf_pkl, pages_jsonl, q, k=12)
+        hits = [h for h in rank_topk(tfidf_pkl, pages_jsonl, q, k=12, dense_pkl=dense_pkl)
                 if h.get("project_id") == project_id]
         for h in hits:
             key = (h["file_path"], h.get("page", 0),
@@ -105,6 +118,7 @@ def extract_for_project(project_id: str, tfidf_pkl: Path, pages_jsonl: Path) ->
             if len(evidence) >= 5:
                 break
 
+    profiler.count("evidence_excerpts", len(evidence[:10]))
     excerpts = []
     for h in evidence[:10]:
         snippet = h.get("text", "")
@@ -114,17 +128,14 @@ def extract_for_project(project_id: str, tfidf_pkl: Path, pages_jsonl: Path) ->
         excerpts.append(
             f"[{h['file_path']} | {loc} | score {h.get('score',0):.3f}]\n{snippet}")
 
-    schema = json.dumps(SCHEMA_EXAMPLE, ensure_ascii=False)
+    schema = json.dumps(LLM_SCHEMA, ensure_ascii=False)
     content = PROMPT_TEMPLATE.format(
         schema=schema, excerpts="\n\n".join(excerpts))
 
-    llm = LLMClient(ARTIFACTS_DIR / "cache", OUTPUTS_DIR / "cost_log.jsonl")
+    llm = LLMClient(artifacts_dir / "cache", outputs_dir / "cost_log.jsonl")
 
-    raw = {}
     try:
-        out = llm.chat(content)
-        if out and out.strip().startswith("{"):
-            raw = json.loads(out)
+        raw = llm.chat_json(content, LLM_SCHEMA)
     except Exception:
         raw = {}
 
@@ -0,0 +1,127 @@
+import json
+
+_CLOSE = {"}": "{", "]": "["}
+# First character of a JSON value of each schema type.
+_OPENER = {str: '"', list: "[", dict: "{"}
+
+
+# Incrementally checks a streamed completion for a single top-level JSON object.
+# Flags clearly invalid output as soon as it appears (prose instead of "{",
+# mismatched brackets, a schema field whose value has the wrong type) and
+# tracks which top-level keys were produced.
+class StreamingJSONValidator:
+    def __init__(self, schema: dict):
+        self.openers = {k: _OPENER.get(type(v)) for k, v in schema.items()}
+        self.keys = set()
+        self.invalid = None
+        self.done = False
+        self._chars = []
+        self._start = None
+        self._end = None
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._in_fence = False
+        self._expect_key = False
+        self._key_chars = None
+        self._pending_key = None
+        self._value_key = None
+
+    # Feed the next chunk; returns False once the output is known to be invalid.
+    def feed(self, chunk: str) -> bool:
+        for ch in chunk:
+            if self.invalid or self.done:
+                break
+            pos = len(self._chars)
+            self._chars.append(ch)
+            if self._start is None:
+                self._before_object(ch, pos)
+            elif self._in_string:
+                self._string_char(ch)
+            else:
+                self._structural_char(ch, pos)
+        return self.invalid is None
+
+    def _before_object(self, ch: str, pos: int):
+        if self._in_fence:
+            # Skip a leading ```json line
+            if ch == "\n":
+                self._in_fence = False
+        elif ch == "{":
+            self._start = pos
+            self._stack.append("{")
+            self._expect_key = True
+        elif ch == "`":
+            self._in_fence = True
+        elif not ch.isspace():
+            self.invalid = "not_a_json_object"
+
+    def _string_char(self, ch: str):
+        if self._escape:
+            self._escape = False
+        elif ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            if self._key_chars is not None:
+                self._pending_key = "".join(self._key_chars)
+                self._key_chars = None
+            return
+        if self._key_chars is not None:
+            self._key_chars.append(ch)
+
+    # Check the first character of a top-level value against its schema type
+    # (null is accepted for any field).
+    def _check_value(self, ch: str):
+        key, self._value_key = self._value_key, None
+        opener = self.openers.get(key)
+        if opener is not None and ch not in (opener, "n"):
+            self.invalid = f"type_mismatch:{key}"
+
+    def _structural_char(self, ch: str, pos: int):
+        if self._value_key is not None and not ch.isspace():
+            self._check_value(ch)
+            if self.invalid:
+                return
+        top_level = len(self._stack) == 1
+        if ch == '"':
+            self._in_string = True
+            if top_level and self._expect_key:
+                self._key_chars = []
+        elif ch == ":" and top_level and self._pending_key is not None:
+            self.keys.add(self._pending_key)
+            self._value_key = self._pending_key
+            self._pending_key = None
+            self._expect_key = False
+        elif ch == "," and top_level:
+            self._expect_key = True
+        elif ch in "{[":
+            self._stack.append(ch)
+        elif ch in "}]":
+            if not self._stack or self._stack[-1] != _CLOSE[ch]:
+                self.invalid = "mismatched_bracket"
+                return
+            self._stack.pop()
+            if not self._stack:
+                self.done = True
+                self._end = pos
+
+    # The complete JSON object text (only once done).
+    def text(self) -> str:
+        if not self.done:
+            return ""
+        return "".join(self._chars[self._start:self._end + 1])
+
+    def streamed_chars(self) -> int:
+        return len(self._chars)
+
+
+# Parse a JSON object string; None if it is not a usable (non-error) object.
+def loads_object(s: str | None) -> dict | None:
+    try:
+        obj = json.loads(s) if s else None
+    except ValueError:
+        return None
+    if not isinstance(obj, dict) or "error" in obj:
+        return None
+    return obj
@@ -3,8 +3,31 @@ from pathlib import Path
 from idea_indexer.utils.cache import SimpleCache
 from idea_indexer.utils.costlog import CostLogger
 from idea_indexer.settings import settings
+from idea_indexer.utils.profiling import profiler
+from idea_indexer.llm.json_stream import StreamingJSONValidator, loads_object
 from openai import OpenAI
 
+# Follow-up prompt that asks only for the fields missing from a previous answer.
+REPAIR_TEMPLATE = (
+    "Your previous answer omitted some fields. Return JSON with exactly these keys "
+    "(and no others), filled from the request below.\n"
+    "Schema: {schema}\n"
+    "Request:\n{content}\n"
+)
+
+# Appended once when the first answer was not a valid JSON object.
+RETRY_SUFFIX = "\nReturn a single JSON object only, with no text before or after it.\n"
+
+
+# True for the stub returned when a streamed answer was not a usable JSON object
+# (budget, client and API errors are not worth retrying).
+def _is_invalid_json(out: str) -> bool:
+    try:
+        err = json.loads(out).get("error", "")
+    except (ValueError, AttributeError):
+        return True
+    return isinstance(err, str) and err.startswith("invalid_json")
+
 
 # Thin LLM wrapper with cache and simple cost logging.
 class LLMClient:
@@ -31,12 +54,23 @@ class LLMClient:
     def _cache_key(self, model: str, content: str) -> str:
         return json.dumps({"m": model, "c": content}, ensure_ascii=False)
 
-    # Return raw LLM string response (or JSON error stub on failure)
-    def chat(self, content: str) -> str:
+    def _messages(self, content: str) -> list:
+        return [
+            {"role": "system",
+                "content": "You are an extraction service. Output only JSON."},
+            {"role": "user", "content": content},
+        ]
+
+    # Return raw LLM string response (or JSON error stub on failure).
+    # With a schema, the response is streamed and validated as a JSON object;
+    # only valid objects are cached, so a bad paid call is not replayed.
+    def chat(self, content: str, schema: dict | None = None) -> str:
         key = self._cache_key(settings.openai_model, content)
         cached = self.cache.get(key)
-        if cached:
+        if cached and (schema is None or loads_object(cached) is not None):
+            profiler.count("llm_cache_hits")
             return cached
+        profiler.count("llm_cache_misses")
 
         # Budget guard
         if self.cost_logger.total_cost() >= settings.token_budget_usd:
@@ -45,7 +79,8 @@ class LLMClient:
                               ensure_ascii=False)
             self.cost_logger.log(settings.openai_model, 0,
                                  0, error="budget_exceeded")
-            self.cache.set(key, stub)
+            if schema is None:
+                self.cache.set(key, stub)
             return stub
 
         if not self._ensure_client():
@@ -54,26 +89,100 @@ class LLMClient:
                               ensure_ascii=False)
             self.cost_logger.log(settings.openai_model, 0,
                                  0, error="no_api_key_or_client")
-            self.cache.set(key, stub)
+            if schema is None:
+                self.cache.set(key, stub)
             return stub
 
+        error = None
         try:
-            res = self.client.chat.completions.create(
-                model=settings.openai_model,
-                messages=[
-                    {"role": "system",
-                        "content": "You are an extraction service. Output only JSON."},
-                    {"role": "user", "content": content},
-                ],
-            )
-            out = (res.choices[0].message.content or "").strip()
-            usage = getattr(res, "usage", None)
-            pt = getattr(usage, "prompt_tokens", 0) or 0
-            ct = getattr(usage, "completion_tokens", 0) or 0
-            self.cost_logger.log(settings.openai_model, pt, ct, error=None)
+            if schema is None:
+                with profiler.stage("llm.wait"):
+                    res = self.client.chat.completions.create(
+                        model=settings.openai_model,
+                        messages=self._messages(content),
+                    )
+                out = (res.choices[0].message.content or "").strip()
+                usage = getattr(res, "usage", None)
+                pt = getattr(usage, "prompt_tokens", 0) or 0
+                ct = getattr(usage, "completion_tokens", 0) or 0
+            else:
+                out, pt, ct, error = self._stream_json(content, schema)
+            profiler.count("prompt_tokens", pt)
+            profiler.count("completion_tokens", ct)
+            self.cost_logger.log(settings.openai_model, pt, ct, error=error)
         except Exception as e:
-            out = json.dumps({"error": str(e)}, ensure_ascii=False)
-            self.cost_logger.log(settings.openai_model, 0, 0, error=str(e))
+            error = str(e)
+            out = json.dumps({"error": error}, ensure_ascii=False)
+            self.cost_logger.log(settings.openai_model, 0, 0, error=error)
 
-        self.cache.set(key, out)
+        if schema is None or error is None:
+            self.cache.set(key, out)
         return out
+
+    # Stream a JSON-mode completion and stop reading as soon as it is clearly invalid.
+    # Returns (text, prompt_tokens, completion_tokens, error).
+    def _stream_json(self, content: str, schema: dict):
+        kwargs = {}
+        if settings.openai_json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        validator = StreamingJSONValidator(schema)
+        pt = ct = 0
+        with profiler.stage("llm.wait"):
+            stream = self.client.chat.completions.create(
+                model=settings.openai_model,
+                messages=self._messages(content),
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs,
+            )
+            try:
+                for chunk in stream:
+                    usage = getattr(chunk, "usage", None)
+                    if usage is not None:
+                        pt = getattr(usage, "prompt_tokens", 0) or 0
+                        ct = getattr(usage, "completion_tokens", 0) or 0
+                    for choice in (chunk.choices or []):
+                        delta = getattr(choice.delta, "content", None)
+                        if delta and not validator.feed(delta):
+                            break
+                    if validator.invalid:
+                        break
+            finally:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+
+        if validator.invalid:
+            profiler.count("llm_aborted_streams")
+            # Usage never arrives on an aborted stream; estimate ~4 chars per token
+            pt = pt or len(content) // 4
+            ct = ct or validator.streamed_chars() // 4
+            error = f"invalid_json:{validator.invalid}"
+        elif not validator.done:
+            error = "invalid_json:truncated"
+        elif loads_object(validator.text()) is None:
+            error = "invalid_json:unparseable"
+        else:
+            return validator.text(), pt, ct, None
+        return json.dumps({"error": error}, ensure_ascii=False), pt, ct, error
+
+    # Ask for a JSON object matching schema (every key must be filled by the LLM).
+    # An invalid/aborted answer is retried once; if keys are missing, re-ask only for those.
+    def chat_json(self, content: str, schema: dict) -> dict:
+        out = self.chat(content, schema)
+        data = loads_object(out)
+        if data is None and _is_invalid_json(out):
+            profiler.count("llm_retry_calls")
+            data = loads_object(self.chat(content + RETRY_SUFFIX, schema))
+        if data is None:
+            return {}
+        missing = {k: v for k, v in schema.items() if k not in data}
+        if missing:
+            profiler.count("llm_repair_calls")
+            repair = loads_object(self.chat(REPAIR_TEMPLATE.format(
+                schema=json.dumps(missing, ensure_ascii=False),
+                content=content), missing)) or {}
+            for k in missing:
+                if k in repair:
+                    data[k] = repair[k]
+        return data
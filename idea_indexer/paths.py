@@ -1,8 +1,37 @@
+import os
+import re
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parents[1]
-DATA_DIR = BASE_DIR / "data"
-ARTIFACTS_DIR = BASE_DIR / "artifacts"
-OUTPUTS_DIR = BASE_DIR / "outputs"
-ARTIFACTS_DIR.mkdir(parents=True, exist_ok=True)
-OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
+CORPORA_DIR = Path(os.getenv("CORPORA_DIR", BASE_DIR / "corpora"))
+
+_CORPUS_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+
+# data/, artifacts/ and outputs/ of one corpus (tenant).
+# No name -> the original single-corpus layout under BASE_DIR;
+# a name -> CORPORA_DIR/<name>/{data,artifacts,outputs}.
+class CorpusPaths:
+    def __init__(self, name: str | None = None):
+        if name and not _CORPUS_NAME.match(name):
+            raise ValueError(f"Invalid corpus name: {name!r}")
+        self.name = name or ""
+        root = CORPORA_DIR / name if name else BASE_DIR
+        self.data_dir = root / "data"
+        self.artifacts_dir = root / "artifacts"
+        self.outputs_dir = root / "outputs"
+        # Serialises ingest / build-index writers of this corpus
+        self.lock_path = self.artifacts_dir / ".index.lock"
+
+    def ensure(self):
+        self.artifacts_dir.mkdir(parents=True, exist_ok=True)
+        self.outputs_dir.mkdir(parents=True, exist_ok=True)
+        return self
+
+
+# Default single-corpus layout; $CORPUS is applied (and validated) by the CLI,
+# so a bad value cannot break importing this module.
+default_paths = CorpusPaths()
+DATA_DIR = default_paths.data_dir
+ARTIFACTS_DIR = default_paths.artifacts_dir
+OUTPUTS_DIR = default_paths.outputs_dir
@@ -6,6 +6,10 @@ class Settings:
     openai_api_key = os.getenv("OPENAI_API_KEY")
     openai_model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
     token_budget_usd = float(os.getenv("TOKEN_BUDGET_DOLLARS", "3.0"))
+    openai_json_mode = os.getenv("OPENAI_JSON_MODE", "1") == "1"
+    dense_retrieval = os.getenv("DENSE_RETRIEVAL", "0") == "1"
+    pdf_workers = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+    pdf_skip_image_only = os.getenv("PDF_SKIP_IMAGE_ONLY", "0") == "1"
 
 
 settings = Settings()
@@ -1,5 +1,6 @@
 import hashlib
 from pathlib import Path
+from idea_indexer.utils.atomic import atomic_path
 
 
 # File-based cache storing JSON/text by hashed key.
@@ -17,4 +18,5 @@ class SimpleCache:
         return p.read_text(encoding="utf-8") if p.exists() else None
 
     def set(self, key: str, value: str):
-        self._path(key).write_text(value, encoding="utf-8")
+        with atomic_path(self._path(key)) as tmp:
+            tmp.write_text(value, encoding="utf-8")
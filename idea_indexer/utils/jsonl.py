@@ -1,14 +1,14 @@
 import json
 from pathlib import Path
+from idea_indexer.utils.atomic import atomic_path
 
 
-# Write a list of dicts as JSONL file.
+# Write a list of dicts as JSONL file (atomically replaced).
 def write_jsonl(path, rows):
-    path = Path(path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as f:
-        for r in rows:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    with atomic_path(path) as tmp:
+        with tmp.open("w", encoding="utf-8") as f:
+            for r in rows:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
 
 
 # Read JSONL file line by line.
@@ -20,9 +20,17 @@ def read_jsonl(path):
                 yield json.loads(line)
 
 
-# Write a JSON object.
+# Write a JSON object (atomically replaced).
 def write_json(path, obj):
+    with atomic_path(path) as tmp:
+        tmp.write_text(json.dumps(obj, ensure_ascii=False,
+                       indent=2), encoding="utf-8")
+
+
+# Append a list of dicts to a JSONL file.
+def append_jsonl(path, rows):
     path = Path(path)
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(obj, ensure_ascii=False,
-                    indent=2), encoding="utf-8")
+    with path.open("a", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
@@ -1,10 +1,87 @@
+import hashlib
+import json
 from pathlib import Path
 import fitz
+from idea_indexer.utils.cache import SimpleCache
+from idea_indexer.utils.profiling import profiler
 
+# PDFs with at least this many missing pages are split into PAGES_PER_TASK chunks;
+# smaller ones go to the pool as a single task.
+PARALLEL_MIN_PAGES = 32
+PAGES_PER_TASK = 16
+
+
+# Content hash of a file, used to key the per-page text cache.
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# A page with no fonts has no text layer (scans / drawings), so skip get_text.
+def _page_text(page, skip_image_only: bool) -> str:
+    if skip_image_only and not page.get_fonts(full=True):
+        return ""
+    return page.get_text("text") or ""
+
+
+# Worker: extract a list of 1-based page numbers from one PDF.
+def _extract_pages(path: str, pages: list, skip_image_only: bool):
+    with fitz.open(path) as doc:
+        return [(n, _page_text(doc[n - 1], skip_image_only)) for n in pages]
+
+
+# Start extracting a PDF and return a callable that yields (page, text) in order.
+# Pages already in cache_dir are not re-rendered. With an executor, the missing
+# pages are submitted right away (one task for a small PDF, page chunks for a
+# large one), so several files render concurrently before any is collected.
+def submit_pdf_pages(path: Path, cache_dir: Path | None = None, executor=None,
+                     skip_image_only: bool = False):
+    cache = SimpleCache(cache_dir) if cache_dir is not None else None
+    doc_hash = file_sha256(path) if cache is not None else ""
+
+    def key(n: int) -> str:
+        return json.dumps({"doc": doc_hash, "page": n, "skip": skip_image_only})
 
-# Extract text from each page of a PDF file (PyMuPDF).
-def extract_pdf_pages(path: Path):
     with fitz.open(str(path)) as doc:
-        for i, page in enumerate(doc, start=1):
-            text = page.get_text("text") or ""
-            yield i, text
+        page_count = doc.page_count
+
+    texts = {}
+    if cache is not None:
+        for n in range(1, page_count + 1):
+            cached = cache.get(key(n))
+            if cached is not None:
+                texts[n] = cached
+        profiler.count("page_cache_hits", len(texts))
+    missing = [n for n in range(1, page_count + 1) if n not in texts]
+    profiler.count("pages_rendered", len(missing))
+
+    futures = []
+    if executor is not None and missing:
+        size = PAGES_PER_TASK if len(missing) >= PARALLEL_MIN_PAGES else len(missing)
+        futures = [executor.submit(_extract_pages, str(path),
+                                   missing[i:i + size], skip_image_only)
+                   for i in range(0, len(missing), size)]
+
+    def collect():
+        if executor is not None:
+            results = [pair for fut in futures for pair in fut.result()]
+        else:
+            results = _extract_pages(str(path), missing, skip_image_only) \
+                if missing else []
+        for n, text in results:
+            texts[n] = text
+            if cache is not None:
+                cache.set(key(n), text)
+        for n in range(1, page_count + 1):
+            yield n, texts[n]
+
+    return collect
+
+
+# Extract text from each page of a PDF file (PyMuPDF).
+def extract_pdf_pages(path: Path, cache_dir: Path | None = None, executor=None,
+                      skip_image_only: bool = False):
+    yield from submit_pdf_pages(path, cache_dir, executor, skip_image_only)()
@@ -0,0 +1,160 @@
+import cProfile
+import pstats
+import os
+import re
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from idea_indexer.utils.jsonl import append_jsonl
+from idea_indexer.utils.atomic import atomic_path
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+METRIC_PREFIX = "talktodoc"
+
+
+# Current resident memory of this process in bytes (None if unsupported).
+def rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+# Peak resident memory over the process lifetime in bytes (None if unsupported).
+def max_rss_bytes() -> int | None:
+    if resource is None:
+        return None
+    peak = int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    # macOS reports ru_maxrss in bytes, Linux in KiB
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name).lower()
+
+
+# Collects per-stage timings, counters and memory snapshots for one command run.
+class Profiler:
+    def __init__(self):
+        self.reset()
+
+    def reset(self, command: str = "", corpus: str = ""):
+        self.command = command
+        self.corpus = corpus
+        self.run_id = uuid.uuid4().hex[:12]
+        self.events = []
+        self.stage_seconds = {}
+        self.stage_calls = {}
+        self.counters = {}
+        self._cprofile = None
+
+    # Time a block of work and record it as a stage event.
+    # Memory is current RSS at the end of the stage and its change over the stage.
+    @contextmanager
+    def stage(self, name: str):
+        rss_start = rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stage_seconds[name] = self.stage_seconds.get(
+                name, 0.0) + elapsed
+            self.stage_calls[name] = self.stage_calls.get(name, 0) + 1
+            rss_end = rss_bytes()
+            self._event("stage", name, seconds=round(elapsed, 6),
+                        rss_bytes=rss_end,
+                        rss_delta_bytes=None if rss_end is None or rss_start is None
+                        else rss_end - rss_start)
+
+    # Increase a named counter (pages_parsed, cache_hits, prompt_tokens, ...).
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    # Record the current resident memory under a label.
+    def memory(self, label: str):
+        self._event("memory", label, rss_bytes=rss_bytes())
+
+    def _event(self, kind: str, name: str, **fields):
+        self.events.append({
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "run_id": self.run_id,
+            "command": self.command,
+            "corpus": self.corpus,
+            "kind": kind,
+            "name": name,
+            **fields,
+        })
+
+    # Wrap the rest of the run in cProfile (stats are dumped by flush()).
+    def start_cprofile(self):
+        self._cprofile = cProfile.Profile()
+        self._cprofile.enable()
+
+    def summary(self) -> dict:
+        return {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "run_id": self.run_id,
+            "command": self.command,
+            "corpus": self.corpus,
+            "kind": "summary",
+            "stages": {k: round(v, 6) for k, v in self.stage_seconds.items()},
+            "counters": dict(self.counters),
+            "max_rss_bytes": max_rss_bytes(),
+        }
+
+    # Render stage timings and counters in the Prometheus text format.
+    def to_prometheus(self) -> str:
+        p = METRIC_PREFIX
+        labels = f'command="{self.command}",corpus="{self.corpus}"'
+        lines = [
+            f"# HELP {p}_stage_seconds_total Wall time spent per pipeline stage.",
+            f"# TYPE {p}_stage_seconds_total counter",
+        ]
+        for name, secs in sorted(self.stage_seconds.items()):
+            lines.append(
+                f'{p}_stage_seconds_total{{{labels},stage="{name}"}} {secs:.6f}')
+        lines += [
+            f"# HELP {p}_stage_calls_total Number of times each stage ran.",
+            f"# TYPE {p}_stage_calls_total counter",
+        ]
+        for name, calls in sorted(self.stage_calls.items()):
+            lines.append(
+                f'{p}_stage_calls_total{{{labels},stage="{name}"}} {calls}')
+        for name, value in sorted(self.counters.items()):
+            metric = f"{p}_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{{{labels}}} {value}")
+        rss = max_rss_bytes()
+        if rss is not None:
+            lines.append(f"# HELP {p}_max_rss_bytes Peak resident memory of the run.")
+            lines.append(f"# TYPE {p}_max_rss_bytes gauge")
+            lines.append(f"{p}_max_rss_bytes{{{labels}}} {rss}")
+        return "\n".join(lines) + "\n"
+
+    # Append events + summary to the trace file and write metrics / cProfile stats.
+    def flush(self, trace_path: Path, metrics_path: Path, profile_path: Path | None = None):
+        append_jsonl(trace_path, self.events + [self.summary()])
+        with atomic_path(metrics_path) as tmp:
+            tmp.write_text(self.to_prometheus(), encoding="utf-8")
+
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            if profile_path is not None:
+                self._cprofile.dump_stats(str(profile_path))
+                stats_txt = Path(profile_path).with_suffix(".txt")
+                with stats_txt.open("w", encoding="utf-8") as f:
+                    pstats.Stats(self._cprofile, stream=f).sort_stats(
+                        "cumulative").print_stats(40)
+            self._cprofile = None
+
+
+profiler = Profiler()
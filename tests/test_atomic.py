@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+import stat
+import time
+import pytest
+from idea_indexer.paths import CorpusPaths
+from idea_indexer.utils.atomic import atomic_path, file_lock
+
+
+def _hold_lock(path, started, shared=False):
+    with file_lock(path, shared=shared):
+        started.set()
+        time.sleep(0.5)
+
+
+def _wait_for_lock(lock, holder_shared, shared):
+    started = multiprocessing.Event()
+    proc = multiprocessing.Process(target=_hold_lock,
+                                   args=(lock, started, holder_shared))
+    proc.start()
+    started.wait(5)
+    t0 = time.perf_counter()
+    with file_lock(lock, shared=shared):
+        waited = time.perf_counter() - t0
+    proc.join()
+    return waited
+
+
+def test_atomic_path_keeps_old_file_on_failure(tmp_path):
+    target = tmp_path / "pages.jsonl"
+    target.write_text("old", encoding="utf-8")
+    with pytest.raises(RuntimeError):
+        with atomic_path(target) as tmp:
+            tmp.write_text("half", encoding="utf-8")
+            raise RuntimeError("crash mid-write")
+    assert target.read_text(encoding="utf-8") == "old"
+    assert list(tmp_path.iterdir()) == [target]
+
+
+def test_atomic_path_keeps_target_mode_or_uses_umask(tmp_path):
+    target = tmp_path / "page_ids.jsonl"
+    with atomic_path(target) as tmp:
+        tmp.write_text("new", encoding="utf-8")
+    umask = os.umask(0)
+    os.umask(umask)
+    assert stat.S_IMODE(target.stat().st_mode) == 0o666 & ~umask
+
+    target.chmod(0o640)
+    with atomic_path(target) as tmp:
+        tmp.write_text("newer", encoding="utf-8")
+    assert stat.S_IMODE(target.stat().st_mode) == 0o640
+
+
+def test_file_lock_blocks_second_process(tmp_path):
+    assert _wait_for_lock(tmp_path / ".index.lock", False, False) > 0.2
+
+
+def test_readers_share_the_lock_but_wait_for_a_writer(tmp_path):
+    lock = tmp_path / ".index.lock"
+    assert _wait_for_lock(lock, True, True) < 0.2
+    assert _wait_for_lock(lock, False, True) > 0.2
+    assert _wait_for_lock(lock, True, False) > 0.2
+
+
+def test_corpus_paths_are_namespaced():
+    acme = CorpusPaths("acme")
+    assert acme.artifacts_dir.parent.name == "acme"
+    assert acme.artifacts_dir != CorpusPaths().artifacts_dir
+    with pytest.raises(ValueError):
+        CorpusPaths("../other")
+
+
+def test_ingest_rejects_corpus_without_data_dir(tmp_path, monkeypatch):
+    from typer.testing import CliRunner
+    from app import app as cli_app
+    monkeypatch.setattr("idea_indexer.paths.CORPORA_DIR", tmp_path)
+    r = CliRunner().invoke(cli_app, ["--corpus", "nope", "ingest"])
+    assert r.exit_code == 2 and "--corpus" in r.output
+    assert not (tmp_path / "nope").exists()
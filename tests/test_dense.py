@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from idea_indexer.indexing.dense import DenseIndex, reciprocal_rank_fusion
+
+
+def test_dense_index_is_int8_and_ivf_matches_exact_search():
+    texts = [f"page {i} " + t for i, t in enumerate(
+        ["project start date milestones", "contact email phone",
+         "scope overview summary", "drawing sheet depot"] * 50)]
+    index = DenseIndex().fit(texts)
+    assert index.codes.dtype == np.int8
+    assert index.nlist > 1
+
+    exact_ids, _ = index.search("project starting dates", k=5, nprobe=index.nlist)
+    assert "start date" in texts[exact_ids[0]]
+    ann_ids, _ = index.search("project starting dates", k=5, nprobe=2)
+    assert len(ann_ids) == 5
+
+
+def test_reciprocal_rank_fusion_prefers_items_ranked_by_both():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4, 1]], limit=2)
+    assert [i for i, _ in fused] == [1, 3]
+
+
+def test_search_with_only_empty_lists_probed_returns_nothing():
+    index = DenseIndex().fit(["alpha beta", "gamma delta", "epsilon"] * 4)
+    # Simulate empty clusters: every IVF list holds no rows
+    index.offsets = np.zeros(index.nlist + 1, dtype=np.int64)
+    ids, scores = index.search("alpha beta", k=3, nprobe=1)
+    assert ids.size == 0 and scores.size == 0
+
+
+def test_search_refuses_index_built_for_other_pages():
+    index = DenseIndex().fit(["alpha beta", "gamma delta", "epsilon"])
+    with pytest.raises(ValueError):
+        index.search("alpha", k=2, n_docs=5)
+    ids, _ = index.search("alpha", k=2, n_docs=3)
+    assert ids[0] == 0
@@ -0,0 +1,95 @@
+import json
+from types import SimpleNamespace
+from idea_indexer.llm.llm_client import LLMClient
+from idea_indexer.llm.json_stream import StreamingJSONValidator
+from idea_indexer.settings import settings
+
+SCHEMA = {"project_title": "", "start_date": "", "contacts": []}
+
+
+def _chunk(text=None, usage=None):
+    choices = [] if text is None else [
+        SimpleNamespace(delta=SimpleNamespace(content=text))]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class FakeStream:
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for p in self.pieces:
+            self.consumed += 1
+            yield _chunk(p)
+        yield _chunk(usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20))
+
+    def close(self):
+        self.closed = True
+
+
+def _client(tmp_path, replies):
+    llm = LLMClient(tmp_path / "cache", tmp_path / "cost_log.jsonl")
+    streams = []
+
+    def create(**kwargs):
+        streams.append(FakeStream(replies.pop(0)))
+        return streams[-1]
+    llm.client = SimpleNamespace(chat=SimpleNamespace(
+        completions=SimpleNamespace(create=create)))
+    return llm, streams
+
+
+def test_validator_tracks_keys_and_rejects_prose():
+    v = StreamingJSONValidator(SCHEMA)
+    assert v.feed('```json\n{"project_title": "a{b", "contacts": [{"x": 1}]')
+    assert v.feed("}")
+    assert v.done and v.keys == {"project_title", "contacts"}
+    assert json.loads(v.text())["project_title"] == "a{b"
+
+    assert not StreamingJSONValidator(SCHEMA).feed("Sure! Here is")
+    assert not StreamingJSONValidator(SCHEMA).feed('{"a": [1}')
+
+
+def test_validator_aborts_on_schema_type_mismatch():
+    v = StreamingJSONValidator(SCHEMA)
+    assert v.feed('{"start_date": null, "other": 3, "contacts": ')
+    assert not v.feed('"Dana"')
+    assert v.invalid == "type_mismatch:contacts"
+    assert not StreamingJSONValidator(SCHEMA).feed('{"project_title": ["x"]')
+
+
+def test_invalid_stream_aborts_early_and_is_not_cached(tmp_path):
+    llm, streams = _client(tmp_path, [["I cannot", " help", " with", " that"]])
+    out = llm.chat("excerpts", SCHEMA)
+    assert json.loads(out)["error"].startswith("invalid_json")
+    assert streams[0].consumed == 1 and streams[0].closed
+    assert llm.cache.get(llm._cache_key(settings.openai_model, "excerpts")) is None
+
+
+def test_chat_json_repairs_only_missing_fields(tmp_path):
+    llm, _ = _client(tmp_path, [
+        ['{"project_title": "Depot", ', '"contacts": []}'],
+        ['{"start_date": "2025-01-01"}'],
+    ])
+    data = llm.chat_json("excerpts", SCHEMA)
+    assert data == {"project_title": "Depot", "contacts": [],
+                    "start_date": "2025-01-01"}
+    # Valid answers are cached and replayed without a new call
+    assert llm.chat_json("excerpts", SCHEMA)["project_title"] == "Depot"
+
+
+def test_chat_json_retries_once_after_invalid_answer(tmp_path):
+    llm, streams = _client(tmp_path, [
+        ["Here is the JSON you asked for"],
+        ['{"project_title": "Depot", "start_date": "", "contacts": []}'],
+    ])
+    assert llm.chat_json("excerpts", SCHEMA)["project_title"] == "Depot"
+    assert len(streams) == 2
+
+
+def test_extraction_schema_leaves_out_fields_set_by_code():
+    from idea_indexer.llm.extract import LLM_SCHEMA, SCHEMA_EXAMPLE
+    assert "project_id" not in LLM_SCHEMA and "evidence" not in LLM_SCHEMA
+    assert set(SCHEMA_EXAMPLE) - set(LLM_SCHEMA) == {"project_id", "evidence"}
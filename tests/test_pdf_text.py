@@ -0,0 +1,50 @@
+import fitz
+from idea_indexer.utils import pdf_text
+from idea_indexer.utils.pdf_text import extract_pdf_pages
+
+
+def _make_pdf(path, n_pages):
+    doc = fitz.open()
+    for i in range(n_pages):
+        page = doc.new_page()
+        if i % 2 == 0:
+            page.insert_text((72, 72), f"page number {i + 1}")
+    doc.save(str(path))
+    doc.close()
+
+
+def test_page_cache_avoids_rerendering(tmp_path, monkeypatch):
+    pdf = tmp_path / "doc.pdf"
+    _make_pdf(pdf, 5)
+    cache_dir = tmp_path / "page_cache"
+
+    first = list(extract_pdf_pages(pdf, cache_dir, skip_image_only=True))
+    assert [n for n, _ in first] == [1, 2, 3, 4, 5]
+    assert "page number 1" in first[0][1]
+    assert first[1][1] == ""
+
+    def fail(*args, **kwargs):
+        raise AssertionError("page was rendered again")
+    monkeypatch.setattr(pdf_text, "_extract_pages", fail)
+    assert list(extract_pdf_pages(pdf, cache_dir, skip_image_only=True)) == first
+
+
+class _RecordingExecutor:
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, fn, *args):
+        from concurrent.futures import Future
+        self.tasks.append(args)
+        fut = Future()
+        fut.set_result(fn(*args))
+        return fut
+
+
+def test_small_pdf_is_submitted_to_pool_as_one_task(tmp_path):
+    pdf = tmp_path / "drawing.pdf"
+    _make_pdf(pdf, 3)
+    executor = _RecordingExecutor()
+    pages = list(extract_pdf_pages(pdf, executor=executor))
+    assert [n for n, _ in pages] == [1, 2, 3]
+    assert [args[1] for args in executor.tasks] == [[1, 2, 3]]
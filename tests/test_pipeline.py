@@ -23,7 +23,7 @@ def test_full_pipeline_runs():
     assert (ARTIFACTS_DIR / "tfidf.pkl").exists()
 
     orig_chat = LLMClient.chat
-    LLMClient.chat = lambda self, _: json.dumps({
+    LLMClient.chat = lambda self, *args, **kwargs: json.dumps({
         "project_id": "1",
         "project_title": "Project_Test"
     }, ensure_ascii=False)
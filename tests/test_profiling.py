@@ -0,0 +1,22 @@
+import json
+from idea_indexer.utils.profiling import Profiler
+
+
+def test_profiler_records_stages_and_counters(tmp_path):
+    p = Profiler()
+    p.reset("ingest")
+    with p.stage("ingest.parse"):
+        p.count("pages_parsed", 3)
+    p.count("llm_cache_hits")
+
+    prom = p.to_prometheus()
+    assert 'talktodoc_stage_calls_total{command="ingest",corpus="",stage="ingest.parse"} 1' in prom
+    assert 'talktodoc_pages_parsed_total{command="ingest",corpus=""} 3' in prom
+
+    p.flush(tmp_path / "trace.jsonl", tmp_path / "metrics.prom")
+    lines = [json.loads(line) for line in (tmp_path / "trace.jsonl").read_text(
+        encoding="utf-8").splitlines()]
+    assert lines[0]["kind"] == "stage" and lines[0]["name"] == "ingest.parse"
+    assert lines[0]["rss_bytes"] > 0 and "rss_delta_bytes" in lines[0]
+    assert lines[-1]["kind"] == "summary"
+    assert lines[-1]["counters"] == {"pages_parsed": 3, "llm_cache_hits": 1}
@@ -0,0 +1,25 @@
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from idea_indexer.indexing.scoring import cosine_scores, map_positions, rows_to_csr, topk
+
+
+def test_vectorized_topk_matches_full_sort():
+    texts = [f"doc {i} start date phone {'email ' * (i % 7)}" for i in range(200)]
+    vectorizer = TfidfVectorizer()
+    X = vectorizer.fit_transform(texts)
+    qvec = vectorizer.transform(["email phone"])
+
+    sims = cosine_scores(qvec, rows_to_csr(X.toarray().tolist()))
+    assert np.allclose(sims, cosine_similarity(qvec, X)[0])
+
+    expected = sorted(range(len(sims)), key=lambda i: sims[i], reverse=True)[:5]
+    assert np.allclose(sims[topk(sims, 5)], sims[expected])
+    assert topk(sims, 500).shape[0] == 200
+
+
+def test_map_positions_keeps_repeated_ids_and_skips_missing_vectors():
+    pos, rows = map_positions([10, 11, 11, 11, 12, 13], [12, 10, 11])
+    assert pos.tolist() == [0, 1, 2, 3, 4]
+    assert rows.tolist() == [1, 2, 2, 2, 0]
+    assert map_positions([1, 2], [])[0].size == 0